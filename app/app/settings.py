@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 from drf_spectacular.settings import SPECTACULAR_DEFAULTS
@@ -88,6 +89,34 @@ DATABASES = {
     }
 }
 
+if os.environ.get('FAST_TESTS'):
+    # 本地跑测试不需要Postgres: 内存SQLite的每条查询都是微秒级,
+    # 没有TCP往返也没有fsync. 不配TEST['NAME'], 让测试库走默认的
+    # ':memory:', pytest-xdist的每个worker进程自然各有一份
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:memdb?mode=memory&cache=shared',
+    }
+
+# manage.py test或任意方式启动的pytest都算测试环境
+TESTING = 'test' in sys.argv or 'pytest' in sys.modules
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if TESTING:
+    # 事务回滚不会同步进程内缓存, 测试时禁用缓存避免读到脏数据
+    CACHES['default']['BACKEND'] = \
+        'django.core.cache.backends.dummy.DummyCache'
+    # 测试里PBKDF2的几十万次迭代纯属浪费CPU, 换成单次MD5
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    # 测试输出里不需要日志
+    import logging
+    logging.disable(logging.CRITICAL)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -136,6 +165,10 @@ AUTH_USER_MODEL = 'core.User'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'COMPONENT_SPLIT_REQUEST': True,
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -0,0 +1,12 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    # orjson是Rust实现, 对字典/列表树比标准库json快数倍
+    # Decimal等orjson不认识的类型用default=str兜底, 输出与DRF默认一致
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return orjson.dumps(data, default=str)
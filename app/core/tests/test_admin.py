@@ -9,18 +9,22 @@ from django.urls import reverse
 
 
 class AdminSiteTests(TestCase):
-    def setUp(self):
-        self.client = Client()
-        self.admin_user = get_user_model().objects.create_superuser(
+    @classmethod
+    def setUpTestData(cls):
+        # 两个用户只创建一次, 每个测试从类级事务的保存点恢复
+        cls.admin_user = get_user_model().objects.create_superuser(
             email="admin@example.com", password="testpass123"
         )
-        self.client.force_login(self.admin_user)
-        self.user = get_user_model().objects.create_user(
+        cls.user = get_user_model().objects.create_user(
             email="user@example.com",
             password="testpass123",
             name="Test user full name"
         )
 
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
     def test_users_list(self):
         url = reverse("admin:core_user_changelist")
         res = self.client.get(url)
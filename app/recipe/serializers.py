@@ -1,24 +1,89 @@
 # app/recipe/serializers.py
+import copy
+import hashlib
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from rest_framework import serializers
 
 from core.models import Recipe, Tag, Ingredient
 
+# 同一个用户反复用同样的标签名, 解析结果在进程内缓存一小段时间
+TAG_IDS_CACHE_TTL = 60
+
+
+def _tag_version_key(user_id):
+    return f'recipe:tag-version:{user_id}'
+
+
+def _tag_ids_cache_key(user_id, names):
+    # 版本号参与key, 标签被删除/改名时整个用户的缓存立即失效
+    version = cache.get_or_set(_tag_version_key(user_id), 1, None)
+    digest = hashlib.md5(','.join(sorted(names)).encode()).hexdigest()
+    return f'recipe:tag-ids:{user_id}:{version}:{digest}'
+
+
+def _touch_recipes(queryset):
+    # 详情接口的ETag只看Recipe.updated_at, 嵌套的标签/配料名变了
+    # 也要把关联食谱的时间戳顶上去, 否则客户端会无限期拿到304.
+    # 用pre_delete而不是post_delete: 级联清掉through行之前
+    # 还能通过关联找到受影响的食谱
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def _tag_changed(sender, instance, **kwargs):
+    if kwargs.get('created'):
+        return
+    try:
+        cache.incr(_tag_version_key(instance.user_id))
+    except ValueError:
+        pass
+    _touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def _ingredient_changed(sender, instance, **kwargs):
+    if kwargs.get('created'):
+        return
+    _touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+class CachedModelSerializer(serializers.ModelSerializer):
+    # get_fields()会对每个声明的字段做deepcopy, 每次实例化都要重新构建
+    # 这里按类缓存第一次的结果, 之后只做浅拷贝(绑定状态仍然是每个实例独立的)
+    _fields_cache = {}
+
+    def get_fields(self):
+        cache = CachedModelSerializer._fields_cache
+        if self.__class__ not in cache:
+            cache[self.__class__] = super().get_fields()
 
-class IngredientSerializer(serializers.ModelSerializer):
+        return {
+            name: copy.copy(field)
+            for name, field in cache[self.__class__].items()
+        }
+
+
+class IngredientSerializer(CachedModelSerializer):
     class Meta:
         model = Ingredient
         fields = ['id', 'name']
         read_only_fields = ['id', ]
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(CachedModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
         read_only_fields = ['id', ]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(CachedModelSerializer):
     # 多对多关系
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
@@ -31,30 +96,71 @@ class RecipeSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', ]  # id字段只读
 
-    def _get_or_create_tags(self, tags, recipe):
+    def _get_or_create_tags(self, tags):
+        # 批量查询/创建标签并返回id列表, 每个请求最多2条SQL;
+        # 同一个用户重复提交同样的名称时直接命中进程内缓存, 零SQL
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
+        names = {tag['name'] for tag in tags}
+        if not names:
+            return []
+
+        cache_key = _tag_ids_cache_key(auth_user.id, names)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        if not hasattr(self, '_tag_cache'):
+            self._tag_cache = {}
+        missing = {
+            name for name in names
+            if (auth_user.id, name) not in self._tag_cache
+        }
+        if missing:
+            # (user, name)有唯一约束, ignore_conflicts在Postgres上编译成
+            # ON CONFLICT DO NOTHING, 不需要先查一遍已有名称
+            Tag.objects.bulk_create(
+                [Tag(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True
             )
-            recipe.tags.add(tag_obj)
+            for tag_id, name in Tag.objects.filter(
+                user=auth_user, name__in=missing
+            ).values_list('id', 'name'):
+                self._tag_cache[(auth_user.id, name)] = tag_id
 
-    def _get_or_create_ingredients(self, ingredients, recipe):
+        tag_ids = [self._tag_cache[(auth_user.id, name)] for name in names]
+        cache.set(cache_key, tag_ids, TAG_IDS_CACHE_TTL)
+        return tag_ids
+
+    def _get_or_create_ingredients(self, ingredients):
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        names = {ingredient['name'] for ingredient in ingredients}
+        existing = set(Ingredient.objects.filter(
+            user=auth_user, name__in=names
+        ).values_list('name', flat=True))
+        Ingredient.objects.bulk_create(
+            [Ingredient(user=auth_user, name=name)
+             for name in names - existing],
+            ignore_conflicts=True
+        )
+        return list(Ingredient.objects.filter(user=auth_user, name__in=names))
 
     def create(self, validated_data):
         tags = validated_data.pop('tags', [])  # 获取标签
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        # 新建的食谱还没有任何关联, 直接批量写through表,
+        # 省掉add()入口处的重复检查SELECT
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for tag_id in self._get_or_create_tags(tags)
+        ], ignore_conflicts=True)
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient.id
+            )
+            for ingredient in self._get_or_create_ingredients(ingredients)
+        ], ignore_conflicts=True)
 
         return recipe
 
@@ -62,12 +168,21 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            # set()只会写入实际变化的关联行, 不需要先clear()再逐个加回
+            instance.tags.set(self._get_or_create_tags(tags))
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            instance.ingredients.set(
+                self._get_or_create_ingredients(ingredients)
+            )
+
+        if self.partial:
+            # PATCH时只更新传入的列, 避免整行UPDATE
+            # filter().update()不会触发auto_now, 手动带上updated_at
+            changed = dict(validated_data, updated_at=timezone.now())
+            Recipe.objects.filter(pk=instance.pk).update(**changed)
+            instance.refresh_from_db(fields=list(changed))
+            return instance
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -76,6 +191,39 @@ class RecipeSerializer(serializers.ModelSerializer):
         return instance
 
 
+class RecipeListListSerializer(serializers.ListSerializer):
+    # 只读列表输出: 整个列表解析一次child的字段, 不必每行重复属性查找
+    def to_representation(self, data):
+        fields = [
+            (field.field_name, field)
+            for field in self.child._readable_fields
+        ]
+        items = []
+        for obj in data:
+            item = {}
+            for name, field in fields:
+                attribute = field.get_attribute(obj)
+                if attribute is None:
+                    item[name] = None
+                else:
+                    item[name] = field.to_representation(attribute)
+            items.append(item)
+
+        return items
+
+
+class RecipeListSerializer(RecipeSerializer):
+    # 列表接口不嵌套序列化标签/配料, 只返回主键
+    tags = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    ingredients = serializers.PrimaryKeyRelatedField(
+        many=True,
+        read_only=True
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = RecipeListListSerializer
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     class Meta(RecipeSerializer.Meta):
         # 详细序列化器包含描述字段
@@ -1,29 +1,55 @@
 # app/recipe/tests/test_recipe_api.py
+import base64
 import os
 import tempfile
 from decimal import Decimal
 
-from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Recipe, Tag, Ingredient
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.serializers import (RecipeSerializer,
+                                RecipeListSerializer,
+                                RecipeDetailSerializer)
 
 RECIPES_URL = reverse('recipe:recipe-list')  # 食谱列表的URL
 
+# reverse()每次都要遍历整个urlconf, 这里在导入时只解析一次, 之后直接拼接id
+_DETAIL_URL = reverse('recipe:recipe-detail', args=[0]).replace('/0/', '/{}/')
+_UPLOAD_URL = reverse('recipe:recipe-upload-image',
+                      args=[0]).replace('/0/', '/{}/')
+
 
 def detail_url(recipe_id):
-    return reverse('recipe:recipe-detail', args=[recipe_id])  # 生成食谱详情的URL
+    return _DETAIL_URL.format(recipe_id)  # 生成食谱详情的URL
 
 
 def image_upload_url(recipe_id):
-    return reverse('recipe:recipe-upload-image',
-                   args=[recipe_id]
-                   )  # 生成上传图片的URL
+    return _UPLOAD_URL.format(recipe_id)  # 生成上传图片的URL
+
+
+# 预先生成的10x10 JPEG, 上传测试只关心MIME处理, 不需要每次用PIL现编码
+_JPEG_BYTES = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAgGBgcGBQgHBwcJCQgKDBQNDAsL'
+    'DBkSEw8UHRofHh0aHBwgJC4nICIsIxwcKDcpLDAxNDQ0Hyc5PTgyPC4zNDL/'
+    '2wBDAQkJCQwLDBgNDRgyIRwhMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIy'
+    'MjIyMjIyMjIyMjIyMjIyMjIyMjIyMjL/wAARCAAKAAoDASIAAhEBAxEB/8QA'
+    'HwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUF'
+    'BAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkK'
+    'FhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1'
+    'dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXG'
+    'x8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEB'
+    'AQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAEC'
+    'AxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRom'
+    'JygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOE'
+    'hYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU'
+    '1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD5/ooooA//'
+    '2Q=='
+)
 
 
 def create_recipe(user, **params):
@@ -45,7 +71,8 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)  # 创建用户
 
 
-class PublicRecipeAPITests(TestCase):
+class PublicRecipeAPITests(SimpleTestCase):
+    # 未认证的请求不会接触数据库, 用SimpleTestCase省掉事务开销
     def setUp(self):
         self.client = APIClient()  # 初始化API客户端
 
@@ -57,25 +84,33 @@ class PublicRecipeAPITests(TestCase):
 
 
 class PrivateRecipeAPITests(TestCase):
-    def setUp(self):
-        self.client = APIClient()  # 初始化API客户端
-        self.user = create_user(
+    @classmethod
+    def setUpTestData(cls):
+        # 每个类只创建一次用户, 各个测试靠事务回滚隔离
+        cls.user = create_user(
             email='user@example.com',
             password='testpass'
-        )  # 创建并认证用户
+        )
+
+    def setUp(self):
+        self.client = APIClient()  # 初始化API客户端
         self.client.force_authenticate(self.user)
 
     def test_retrieve_recipes(self):
         create_recipe(user=self.user)  # 创建食谱
         create_recipe(user=self.user)
 
-        res = self.client.get(RECIPES_URL)  # 获取食谱列表
+        # 固定查询数, 防止回归重新引入N+1:
+        # ETag聚合 + 食谱查询 + 标签/配料各一次prefetch
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)  # 获取食谱列表
 
         recipes = Recipe.objects.all().order_by('-id')  # 查询所有食谱并按id降序排列
-        serializer = RecipeSerializer(recipes, many=True)  # 序列化食谱列表
+        serializer = RecipeListSerializer(recipes, many=True)  # 序列化食谱列表
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)  # 断言返回200成功
-        self.assertEqual(res.data, serializer.data)  # 断言返回数据与序列化数据一致
+        # 列表接口分页后数据在results里
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         other_user = create_user(
@@ -89,20 +124,40 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.get(RECIPES_URL)  # 获取食谱列表
 
         recipes = Recipe.objects.filter(user=self.user)  # 查询当前用户的食谱
-        serializer = RecipeSerializer(recipes, many=True)  # 序列化食谱列表
+        serializer = RecipeListSerializer(recipes, many=True)  # 序列化食谱列表
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)  # 断言返回200成功
-        self.assertEqual(res.data, serializer.data)  # 断言返回数据与序列化数据一致
+        # 列表接口分页后数据在results里
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         recipe = create_recipe(user=self.user)  # 创建食谱
         url = detail_url(recipe.id)  # 获取食谱详情的URL
-        res = self.client.get(url)  # 获取食谱详情
+        with self.assertNumQueries(4):
+            res = self.client.get(url)  # 获取食谱详情
 
         serializer = RecipeDetailSerializer(recipe)  # 序列化食谱详情
 
         self.assertEqual(res.data, serializer.data)  # 断言返回数据与序列化数据一致
 
+    def test_detail_etag_refreshes_on_tag_rename(self):
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        url = detail_url(recipe.id)
+
+        etag = self.client.get(url)['ETag']
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # 标签改名会改变详情里嵌套的名称, 旧的ETag必须失效
+        tag.name = 'Supper'
+        tag.save()
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Supper')
+
     def test_create_recipe(self):
         payload = {
             'title': 'Chocolate cheesecake',
@@ -219,12 +274,12 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(recipes.count(), 1)
         recipe = recipes[0]
         self.assertEqual(recipe.tags.count(), 2)
-        for tag in payload['tags']:
-            exists = recipe.tags.filter(
-                name=tag['name'],
-                user=self.user,
-            ).exists()
-            self.assertTrue(exists)
+        names = {tag['name'] for tag in payload['tags']}
+        tag_names = set(
+            recipe.tags.filter(user=self.user)
+            .values_list('name', flat=True)
+        )
+        self.assertTrue(names.issubset(tag_names))
 
     def test_create_recipe_with_existing_tags(self):
         tag_indian = Tag.objects.create(user=self.user, name='Indian')
@@ -246,12 +301,12 @@ class PrivateRecipeAPITests(TestCase):
         recipe = recipes[0]
         self.assertEqual(recipe.tags.count(), 2)
         self.assertIn(tag_indian, recipe.tags.all())
-        for tag in payload['tags']:
-            exist = recipe.tags.filter(
-                name=tag['name'],
-                user=self.user,
-            ).exists()
-            self.assertTrue(exist)
+        names = {tag['name'] for tag in payload['tags']}
+        tag_names = set(
+            recipe.tags.filter(user=self.user)
+            .values_list('name', flat=True)
+        )
+        self.assertTrue(names.issubset(tag_names))
 
     def test_create_tag_on_update(self):
         recipe = create_recipe(user=self.user)
@@ -305,12 +360,12 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(recipes.count(), 1)
         recipe = recipes[0]
         self.assertEqual(recipe.ingredients.count(), 2)
-        for ingredient in payload['ingredients']:
-            exists = recipe.ingredients.filter(
-                name=ingredient['name'],
-                user=self.user,
-            ).exists()
-            self.assertTrue(exists)
+        names = {ingredient['name'] for ingredient in payload['ingredients']}
+        ingredient_names = set(
+            recipe.ingredients.filter(user=self.user)
+            .values_list('name', flat=True)
+        )
+        self.assertTrue(names.issubset(ingredient_names))
 
     def test_create_recipe_with_existing_ingredients(self):
         ingredient_chocolate = Ingredient.objects.create(
@@ -335,12 +390,12 @@ class PrivateRecipeAPITests(TestCase):
         recipe = recipes[0]
         self.assertEqual(recipe.ingredients.count(), 2)
         self.assertIn(ingredient_chocolate, recipe.ingredients.all())
-        for ingredient in payload['ingredients']:
-            exists = recipe.ingredients.filter(
-                name=ingredient['name'],
-                user=self.user,
-            ).exists()
-            self.assertTrue(exists)
+        names = {ingredient['name'] for ingredient in payload['ingredients']}
+        ingredient_names = set(
+            recipe.ingredients.filter(user=self.user)
+            .values_list('name', flat=True)
+        )
+        self.assertTrue(names.issubset(ingredient_names))
 
     def test_create_ingredient_on_update(self):
         recipe = create_recipe(user=self.user)
@@ -397,13 +452,13 @@ class PrivateRecipeAPITests(TestCase):
         params = {'tags': f'{tag1.id},{tag2.id}'}
         res = self.client.get(RECIPES_URL, params)
 
-        s1 = RecipeSerializer(r1)
-        s2 = RecipeSerializer(r2)
-        s3 = RecipeSerializer(r3)
+        s1 = RecipeListSerializer(r1)
+        s2 = RecipeListSerializer(r2)
+        s3 = RecipeListSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredient(self):
         r1 = create_recipe(user=self.user, title='Posh beans on toast')
@@ -423,24 +478,88 @@ class PrivateRecipeAPITests(TestCase):
         params = {'ingredients': f'{ingredient1.id},{ingredient2.id}'}
         res = self.client.get(RECIPES_URL, params)
 
-        s1 = RecipeSerializer(r1)
-        s2 = RecipeSerializer(r2)
-        s3 = RecipeSerializer(r3)
+        s1 = RecipeListSerializer(r1)
+        s2 = RecipeListSerializer(r2)
+        s3 = RecipeListSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
 
-class ImageUploadTests(TestCase):
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tag-ids-cache-tests',
+    }
+})
+class TagIdsCacheTests(TestCase):
+    # 测试环境默认DummyCache, 这里换回LocMem,
+    # 专门覆盖跨请求的标签id缓存及其失效逻辑
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(
+            email='cache@example.com',
+            password='testpass'
+        )
+
     def setUp(self):
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
+        request = APIRequestFactory().post(RECIPES_URL)
+        request.user = self.user
+        self.context = {'request': request}
+
+    def tearDown(self):
+        # 事务回滚不会清进程内缓存, 手动清掉避免污染其他测试
+        cache.clear()
+
+    def _resolve(self, *names):
+        serializer = RecipeSerializer(context=self.context)
+        return serializer._get_or_create_tags(
+            [{'name': name} for name in names]
+        )
+
+    def test_repeated_names_hit_cache(self):
+        tag_ids = self._resolve('Vegan', 'Dinner')
+
+        # 第二次解析同样的名称组合直接命中缓存, 不发SQL
+        with self.assertNumQueries(0):
+            self.assertEqual(self._resolve('Vegan', 'Dinner'), tag_ids)
+
+    def test_rename_invalidates_cache(self):
+        (tag_id,) = self._resolve('Vegan')
+
+        tag = Tag.objects.get(id=tag_id)
+        tag.name = 'Plant Based'
+        tag.save()
+
+        # 改名后版本号递增, 'Vegan'重新解析成新建的标签
+        (new_id,) = self._resolve('Vegan')
+        self.assertNotEqual(new_id, tag_id)
+        self.assertTrue(
+            Tag.objects.filter(user=self.user, name='Vegan').exists()
+        )
+
+    def test_delete_invalidates_cache(self):
+        (tag_id,) = self._resolve('Vegan')
+
+        Tag.objects.get(id=tag_id).delete()
+
+        (new_id,) = self._resolve('Vegan')
+        self.assertNotEqual(new_id, tag_id)
+
+
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             'user@example.com',
             'testpass'
         )
+        cls.recipe = create_recipe(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
         self.client.force_authenticate(self.user)
-        self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
         self.recipe.image.delete()
@@ -448,8 +567,7 @@ class ImageUploadTests(TestCase):
     def test_upload_image(self):
         url = image_upload_url(self.recipe.id)
         with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
-            img = Image.new('RGB', (10, 10))
-            img.save(ntf, format='JPEG')
+            ntf.write(_JPEG_BYTES)
             ntf.seek(0)
             payload = {'image': ntf}
             res = self.client.post(url, payload, format='multipart')
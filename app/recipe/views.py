@@ -1,3 +1,6 @@
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (extend_schema_view,
                                    extend_schema,
@@ -5,6 +8,7 @@ from drf_spectacular.utils import (extend_schema_view,
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
@@ -12,6 +16,31 @@ from core.models import Recipe, Tag, Ingredient
 from recipe import serializers
 
 
+def _recipe_list_etag(request, *args, **kwargs):
+    # 一条聚合查询生成ETag, 命中If-None-Match时直接304跳过序列化
+    agg = Recipe.objects.filter(user=request.user).aggregate(
+        count=Count('id'), updated=Max('updated_at')
+    )
+    updated = agg['updated'].timestamp() if agg['updated'] else 0
+    return f'"{agg["count"]}-{updated}"'
+
+
+def _recipe_detail_etag(request, pk=None, *args, **kwargs):
+    updated = Recipe.objects.filter(
+        pk=pk, user=request.user
+    ).values_list('updated_at', flat=True).first()
+    if updated is None:
+        return None
+
+    return f'"{updated.timestamp()}"'
+
+
+class RecipePagination(CursorPagination):
+    # 游标分页沿用-id排序, 深翻页依然是O(1), 每次响应的行数有上限
+    page_size = 50
+    ordering = '-id'
+
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -33,6 +62,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipePagination
 
     def _parms_to_ints(self, qs):
         return [int(str_id) for str_id in qs.split(',')]
@@ -40,7 +70,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        queryset = Recipe.objects.filter(user=self.request.user)
         if tags:
             tag_ids = self._parms_to_ints(tags)
             queryset = queryset.filter(tags__id__in=tag_ids)
@@ -48,12 +78,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredient_ids = self._parms_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
 
-        return (queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            # 列表接口跳过重量级的列: description只出现在详情,
+            # image只在上传接口用到. defer比only稳妥, 序列化器
+            # 以后新增字段不会意外触发逐行补查
+            queryset = queryset.defer('description', 'image')
+
+        return (queryset.prefetch_related('tags', 'ingredients')
                 .order_by('-id').distinct())
 
+    @method_decorator(condition(etag_func=_recipe_list_etag))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(condition(etag_func=_recipe_detail_etag))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.action == 'list':
-            return serializers.RecipeSerializer
+            return serializers.RecipeListSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
 
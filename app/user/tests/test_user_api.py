@@ -1,7 +1,11 @@
+import json
+from types import MappingProxyType
+
+import factory
+import pytest
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.urls import reverse
 from rest_framework import status
-from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
 # 定义用户相关的URL
@@ -9,144 +13,160 @@ CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
 
+# 模型解析一次就够了, 不必每次都走app注册表查找
+User = get_user_model()
+
+pytestmark = pytest.mark.django_db
+
+# 注册接口测试共用的payload, 只读代理避免测试间互相污染
+_PAYLOAD = MappingProxyType({
+    'email': 'test@example.com',
+    'password': 'testpass123',
+    'name': 'Test Name',
+})
+
+# 提前序列化好的JSON正文, POST时跳过测试客户端的渲染器协商
+_PAYLOAD_JSON = json.dumps(dict(_PAYLOAD))
+
 
 # 创建用户的辅助函数
 def create_user(**params):
-    return get_user_model().objects.create_user(**params)
-
-
-# 公共用户API测试类
-class PublicUserApiTests(TestCase):
-    def setUp(self):
-        self.client = APIClient()
-
-    # 测试创建用户成功
-    def test_create_user_success(self):
-        payload = {
-            'email': 'test@example.com',
-            'password': 'testpass123',
-            'name': 'Test Name',
-        }
-        res = self.client.post(CREATE_USER_URL, payload)
-
-        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        user = get_user_model().objects.get(email=payload['email'])
-        self.assertTrue(user.check_password(payload['password']))
-        self.assertNotIn('password', res.data)
-
-    # 测试用户邮箱已存在
-    def test_user_with_email_exists(self):
-        payload = {
-            'email': 'test@example.com',
-            'password': 'testpass123',
-            'name': 'Test Name',
-        }
-
-        create_user(**payload)
-
-        res = self.client.post(CREATE_USER_URL, payload)
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-
-    # 测试密码太短
-    def test_password_too_short(self):
-        payload = {
-            'email': 'test@example.com',
-            'password': 'pw',
-            'name': 'Test Name',
-        }
-
-        res = self.client.post(CREATE_USER_URL, payload)
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-        user_exists = get_user_model().objects.filter(
-            email=payload['email']
-        ).exists()
-        self.assertFalse(user_exists)
-
-    # 测试为用户创建令牌
-    def test_create_token_for_user(self):
-        user_details = {
-            'name': 'Test Name',
-            'email': 'test@example.com',
-            'password': 'testpass123',
-        }
-        create_user(**user_details)
-
-        payload = {
-            'email': user_details['email'],
-            'password': user_details['password']
-        }
-
-        res = self.client.post(TOKEN_URL, payload)
-
-        self.assertIn('token', res.data)
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
-
-    # 测试使用错误凭据创建令牌
-    def test_create_token_bad_credentials(self):
-        create_user(email='test@example.com', password='testpass123')
-        payload = {
-            'email': 'test@example.com', 'password': 'badpass'
-        }
-        res = self.client.post(TOKEN_URL, payload)
-
-        self.assertNotIn('token', res.data)
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-
-    # 测试创建令牌时密码为空
-    def test_create_token_blank_password(self):
-        payload = {
-            'email': 'test@example.com',
-            'password': '',
-        }
-        res = self.client.post(TOKEN_URL, payload)
-
-        self.assertNotIn('token', res.data)
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-
-    # 测试未授权用户获取用户信息
-    def test_retrieve_user_unauthorized(self):
-        res = self.client.get(ME_URL)
-
-        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
-
-
-# 私有用户API测试类
-class PrivateUserApiTests(TestCase):
-    def setUp(self):
-        self.user = create_user(
-            email='test@example.com',
-            password='testpass123',
-            name='Test Name'
+    return User.objects.create_user(**params)
+
+
+# 不关心具体邮箱的测试用这个工厂, 序列号保证邮箱唯一
+class UserFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = User
+
+    email = factory.Sequence(lambda n: f'user{n}@example.com')
+    name = 'Test Name'
+    password = factory.PostGenerationMethodCall('set_password', 'testpass123')
+
+
+@pytest.fixture(scope='module')
+def api_client():
+    # 构建APIClient要初始化渲染器/解析器注册表, 整个模块共享一个实例
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    return UserFactory()
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    yield api_client
+    api_client.force_authenticate(user=None)
+
+
+@pytest.fixture(scope='session')
+def shared_user(django_db_setup, django_db_blocker):
+    # 密码哈希开销不小, 只读测试复用一个会话级的用户.
+    # 会话级写入不在测试事务里, --reuse-db时上一轮的行还在,
+    # 用get_or_create保证第二次运行不撞唯一邮箱
+    with django_db_blocker.unblock():
+        user, created = User.objects.get_or_create(
+            email='shared@example.com',
+            defaults={'name': 'Shared Name'},
         )
-        self.client = APIClient()
-        self.client.force_authenticate(user=self.user)
-
-    # 测试成功获取用户信息
-    def test_retrieve_profile_success(self):
-        res = self.client.get(ME_URL)
-
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, {
-            'name': self.user.name,
-            'email': self.user.email
-        })
-
-    # 测试不允许POST请求到ME_URL
-    def test_post_me_not_allowed(self):
-        res = self.client.post(ME_URL, {})
-
-        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
-
-    # 测试更新用户信息
-    def test_update_user_profile(self):
-        payload = {
-            'name': 'New Name',
-            'password': 'newpassword123'
-        }
-
-        res = self.client.patch(ME_URL, payload)
-        self.user.refresh_from_db()
-
-        self.assertEqual(self.user.name, payload['name'])
-        self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        if created:
+            user.set_password('testpass123')
+            user.save(update_fields=['password'])
+        return user
+
+
+@pytest.fixture
+def shared_client(api_client, shared_user):
+    api_client.force_authenticate(user=shared_user)
+    yield api_client
+    api_client.force_authenticate(user=None)
+
+
+# 测试创建用户成功
+def test_create_user_success(api_client):
+    res = api_client.post(CREATE_USER_URL, _PAYLOAD_JSON,
+                          content_type='application/json')
+
+    assert res.status_code == status.HTTP_201_CREATED
+    user = User.objects.get(email=_PAYLOAD['email'])
+    assert user.check_password(_PAYLOAD['password'])
+    assert 'password' not in res.data
+
+
+# 测试用户邮箱已存在
+def test_user_with_email_exists(api_client):
+    create_user(**_PAYLOAD)
+
+    res = api_client.post(CREATE_USER_URL, _PAYLOAD_JSON,
+                          content_type='application/json')
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# 测试密码太短
+def test_password_too_short(api_client):
+    payload = {**_PAYLOAD, 'password': 'pw'}
+
+    res = api_client.post(CREATE_USER_URL, payload)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+    user_exists = User.objects.filter(
+        email=payload['email']
+    ).exists()
+    assert not user_exists
+
+
+# 测试令牌接口: 正确凭据拿到token, 错误密码/空密码返回400
+@pytest.mark.parametrize('password,status_code,has_token', [
+    ('testpass123', status.HTTP_200_OK, True),
+    ('badpass', status.HTTP_400_BAD_REQUEST, False),
+    ('', status.HTTP_400_BAD_REQUEST, False),
+])
+def test_token_endpoint(api_client, shared_user, password, status_code,
+                        has_token):
+    payload = {'email': shared_user.email, 'password': password}
+    res = api_client.post(TOKEN_URL, payload)
+
+    assert res.status_code == status_code
+    assert ('token' in res.data) is has_token
+
+
+# 测试未授权用户获取用户信息
+def test_retrieve_user_unauthorized(api_client):
+    res = api_client.get(ME_URL)
+
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+# 测试成功获取用户信息
+def test_retrieve_profile_success(shared_client, shared_user):
+    res = shared_client.get(ME_URL)
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.data == {
+        'name': shared_user.name,
+        'email': shared_user.email
+    }
+
+
+# 测试不允许POST请求到ME_URL
+def test_post_me_not_allowed(shared_client):
+    res = shared_client.post(ME_URL, {})
+
+    assert res.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+# 测试更新用户信息
+def test_update_user_profile(authenticated_client, user):
+    payload = {
+        'name': 'New Name',
+        'password': 'newpassword123'
+    }
+
+    res = authenticated_client.patch(ME_URL, payload)
+    user.refresh_from_db()
+
+    assert user.name == payload['name']
+    assert user.check_password(payload['password'])
+    assert res.status_code == status.HTTP_200_OK